@@ -1,7 +1,11 @@
+import os
+import warnings
+import multiprocessing
 import numpy as np
 from turbopy import Simulation
-import matplotlib.pyplot as plt
 import spring
+import checkpoint
+import profiling
 
 class Uncertainty:
     def __init__(self, mean_K, mean_M, sd_K = 0,  sd_M = 0): # Initializes an Uncertainty object that can self randomize and run the turboPy Physics Module on itself.
@@ -16,7 +20,7 @@ class Uncertainty:
         self.springConstant = np.random.normal(self.mean_K, self.sd_K)
         self.mass = np.random.normal(self.mean_M, self.sd_M)
 
-    def run(self,t0,t1,steps): # Uses the turboPy Physics Module for the Block on Spring problem.
+    def run(self,t0,t1,steps, directory = "output_leapfrog/"): # Uses the turboPy Physics Module for the Block on Spring problem.
         problem_config = {
             "Grid": {"N": 2, "x_min": 0, "x_max": 1},
             "Clock": {"start_time": t0,
@@ -36,7 +40,7 @@ class Uncertainty:
             },
             "Diagnostics": {
                 # default values come first
-                "directory": "output_leapfrog/",
+                "directory": directory,
                 "output_type": "csv",
                 "clock": {"filename": "time.csv"},
                 "BlockDiagnostic": [
@@ -46,7 +50,9 @@ class Uncertainty:
             }
         }
 
-        sim = Simulation(problem_config)
+        with profiling.phase("Uncertainty.run:setup"):
+            sim = Simulation(problem_config)
+            profiling.instrument(sim)
         sim.run()
 
         time = sim.diagnostics[0].csv._buffer
@@ -59,19 +65,57 @@ class Uncertainty:
         return retDct
 
 class MonteCarlo:
-    def __init__(self,runner, n, t0 = 0, t1 = 12, steps = 1200):   #Runner is an object from the class Uncertainty and n is the number of runs
+    def __init__(self,runner, n, t0 = 0, t1 = 12, steps = 1200, checkpointFile = None, checkpointInterval = 10):   #Runner is an object from the class Uncertainty and n is the number of runs
         dataDct = {}
         randMass = []
         randK = []
-        for i in range(n):
+        start = 0
+        numChunks = 0
+        if checkpointFile is not None and os.path.exists(checkpointFile):   # Resume a campaign that was interrupted part way through.
+            start, numChunks = self.loadCheckpoint(checkpointFile, runner, dataDct)
+        newRuns = []   # Runs finished since the last checkpoint, in order.
+        for i in range(start, n):
             randMass += [runner.mass]
             randK += [runner.springConstant]
             dataDct[(runner.springConstant,runner.mass)] = runner.run(t0,t1,steps)
+            newRuns += [(runner.springConstant, runner.mass)]
             runner.randomizeVars()
+            if checkpointFile is not None and ((i + 1) % checkpointInterval == 0 or i + 1 == n):
+                self.saveCheckpoint(checkpointFile, runner, dataDct, newRuns, numChunks, i + 1)
+                numChunks += 1
+                newRuns = []
         
         self.dataDct = dataDct
 
+    def chunkFilename(self, filename, chunk):
+        return f"{filename}.{chunk:04d}"
+
+    def saveCheckpoint(self, filename, runner, dataDct, newRuns, chunk, numDone):  # Appends the runs finished since the last save as a new chunk file, then updates the small header file holding the RNG and runner state.
+        arrays = {"keys": np.array(newRuns).reshape(-1, 2),
+                  "times": np.array([list(dataDct[key].keys()) for key in newRuns]),
+                  "values": np.array([list(dataDct[key].values()) for key in newRuns])}
+        checkpoint.write_npz(self.chunkFilename(filename, chunk), arrays)
+        # The header is written last, so it never refers to an unfinished chunk.
+        header = {"numDone": np.array(numDone),
+                  "numChunks": np.array(chunk + 1),
+                  "runner": np.array([runner.springConstant, runner.mass])}
+        header.update(checkpoint.get_rng_state())
+        checkpoint.write_npz(filename, header)
+
+    def loadCheckpoint(self, filename, runner, dataDct):  # Fills dataDct from a checkpoint and returns the number of finished runs and of chunk files.
+        with np.load(filename) as header:
+            runner.springConstant, runner.mass = header["runner"]
+            checkpoint.set_rng_state(header)
+            numDone = int(header["numDone"])
+            numChunks = int(header["numChunks"])
+        for chunk in range(numChunks):
+            with np.load(self.chunkFilename(filename, chunk)) as data:
+                for key, times, values in zip(data["keys"], data["times"], data["values"]):
+                    dataDct[(key[0], key[1])] = {t: (v[0], v[1]) for t, v in zip(times, values)}
+        return numDone, numChunks
+
     def displayMaxMomentum(self, title, xMin = 0, xMax = 0):  # xMin and xMax represent the range of the graph.
+        import matplotlib.pyplot as plt  # Imported here so that running simulations does not need matplotlib.
 
         histData = []
         for key in self.dataDct: # Simple max value finder for each iteration of mass and spring constant.
@@ -91,4 +135,172 @@ class MonteCarlo:
         plt.xlabel('Momentum')
         plt.ylabel('Count')
         plt.show()
-                
\ No newline at end of file
+
+
+class RunningStats:
+    def __init__(self, bins = 50, histRange = (0, 1)):  # Streaming count, mean, variance, extrema and fixed-bin histogram of a quantity.
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0   # Sum of squared deviations from the mean.
+        self.min = np.inf
+        self.max = -np.inf
+        self.edges = np.histogram_bin_edges([], bins, range=histRange)
+        self.hist = np.zeros(bins, dtype=np.int64)
+
+    @property
+    def variance(self):
+        return self.m2 / self.count if self.count > 0 else np.nan
+
+    def update(self, values):  # Adds a batch of values to the statistics.
+        values = np.asarray(values, dtype=float)
+        batch = RunningStats()
+        batch.count = len(values)
+        if batch.count > 0:
+            batch.mean = values.mean()
+            batch.m2 = ((values - batch.mean) ** 2).sum()
+            batch.min = values.min()
+            batch.max = values.max()
+        batch.edges = self.edges
+        batch.hist = np.histogram(values, self.edges)[0]
+        self.merge(batch)
+
+    def merge(self, other):  # Combines the statistics of two disjoint sets of samples (Chan et al. pairwise update).
+        if not np.array_equal(self.edges, other.edges):
+            raise ValueError("Cannot merge histograms with different bin edges")
+        count = self.count + other.count
+        if count > 0:
+            delta = other.mean - self.mean
+            self.mean = self.mean + delta * other.count / count
+            self.m2 = self.m2 + other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.hist = self.hist + other.hist
+
+    def toArrays(self, name):
+        return {f"{name}:count": np.array(self.count),
+                f"{name}:mean": np.array(self.mean),
+                f"{name}:m2": np.array(self.m2),
+                f"{name}:min": np.array(self.min),
+                f"{name}:max": np.array(self.max),
+                f"{name}:edges": self.edges,
+                f"{name}:hist": self.hist}
+
+    @classmethod
+    def fromArrays(cls, data, name):
+        stats = cls()
+        stats.count = int(data[f"{name}:count"])
+        stats.mean = float(data[f"{name}:mean"])
+        stats.m2 = float(data[f"{name}:m2"])
+        stats.min = float(data[f"{name}:min"])
+        stats.max = float(data[f"{name}:max"])
+        stats.edges = data[f"{name}:edges"]
+        stats.hist = data[f"{name}:hist"]
+        return stats
+
+
+class Campaign:
+    quantities = ("springConstant", "mass", "maxMomentum")
+
+    def __init__(self, runner, n, numShards, directory, seed = 0, t0 = 0, t1 = 12, steps = 1200, bins = 50, histRanges = None):  # Splits a MonteCarlo of n runs into numShards independently seeded shards stored in directory.
+        self.runner = runner
+        self.n = n
+        self.numShards = numShards
+        self.directory = directory
+        self.t0 = t0
+        self.t1 = t1
+        self.steps = steps
+        self.bins = bins
+        self.shardSizes = [len(a) for a in np.array_split(np.arange(n), numShards)]
+        self.shardSeeds = [int(s.generate_state(1)[0]) for s in np.random.SeedSequence(seed).spawn(numShards)]
+        # Histogram ranges must be the same for every shard so that they can be merged.
+        self.histRanges = {"springConstant": (runner.mean_K - 5 * runner.sd_K, runner.mean_K + 5 * runner.sd_K),
+                           "mass": (runner.mean_M - 5 * runner.sd_M, runner.mean_M + 5 * runner.sd_M),
+                           "maxMomentum": (0, 2 * np.sqrt(abs(runner.mean_K * runner.mean_M)))}
+        if histRanges is not None:
+            self.histRanges.update(histRanges)
+
+    def shardFilename(self, shard):
+        return os.path.join(self.directory, f"shard_{shard:04d}.npz")
+
+    def shardSettings(self, shard):  # Everything that determines a shard's results, as stored in its file.
+        settings = {"seed": np.array(self.shardSeeds[shard]),
+                    "numSamples": np.array(self.shardSizes[shard]),
+                    "time": np.array([self.t0, self.t1]),
+                    "steps": np.array(self.steps),
+                    "runner": np.array([self.runner.mean_K, self.runner.sd_K, self.runner.mean_M, self.runner.sd_M])}
+        for name in self.quantities:
+            settings[f"{name}:edges"] = RunningStats(self.bins, self.histRanges[name]).edges
+        return settings
+
+    def changedSettings(self, shard, data):  # Names of the settings that differ between this campaign and a shard file.
+        return [name for name, value in self.shardSettings(shard).items() if name not in data or not np.array_equal(data[name], value)]
+
+    def isCurrentShard(self, shard):  # True if the shard file exists and was made with this campaign's settings.
+        if not os.path.exists(self.shardFilename(shard)):
+            return False
+        with np.load(self.shardFilename(shard)) as data:
+            changed = self.changedSettings(shard, data)
+        if changed:
+            warnings.warn(f"{self.shardFilename(shard)} was made with different settings {changed} and will be rerun")
+        return not changed
+
+    def missingShards(self):  # Shards with no file, or with a stale file left by a campaign with different settings.
+        return [i for i in range(self.numShards) if not self.isCurrentShard(i)]
+
+    def runShard(self, shard):  # Runs one shard and writes its samples and statistics to its own file.
+        np.random.seed(self.shardSeeds[shard])
+        self.runner.randomizeVars()
+        samples = {name: [] for name in self.quantities}
+        for i in range(self.shardSizes[shard]):
+            runData = self.runner.run(self.t0, self.t1, self.steps, directory=os.path.join(self.directory, f"output_{shard:04d}/"))
+            samples["springConstant"] += [self.runner.springConstant]
+            samples["mass"] += [self.runner.mass]
+            samples["maxMomentum"] += [max(v[0] for v in runData.values())]
+            self.runner.randomizeVars()
+
+        arrays = {"shard": np.array(shard)}
+        arrays.update(self.shardSettings(shard))
+        for name in self.quantities:
+            stats = RunningStats(self.bins, self.histRanges[name])
+            stats.update(samples[name])
+            arrays[name] = np.array(samples[name])
+            arrays.update(stats.toArrays(name))
+        checkpoint.write_npz(self.shardFilename(shard), arrays)
+
+    def runProfiledShard(self, shard, trace, allocations):  # Runs one shard with a fresh profiler and returns it.
+        profiling.enable(trace, allocations)
+        self.runShard(shard)
+        return profiling.disable()
+
+    def run(self, processes = 1):  # Runs every shard that is not already on disk, using a pool of worker processes if processes > 1.
+        os.makedirs(self.directory, exist_ok=True)
+        missing = self.missingShards()
+        if processes > 1 and profiling.active is not None:   # Workers profile their shards separately and send the results back.
+            with multiprocessing.Pool(processes) as pool:
+                profilers = pool.starmap(self.runProfiledShard, [(shard, profiling.active.trace, profiling.active.allocations) for shard in missing])
+            for profiler in profilers:
+                profiling.active.merge(profiler)
+        elif processes > 1:
+            with multiprocessing.Pool(processes) as pool:
+                pool.map(self.runShard, missing)
+        else:
+            for shard in missing:
+                self.runShard(shard)
+
+    def merge(self, allowPartial = False):  # Combines the statistics of all finished shards into one RunningStats per quantity.
+        missing = []
+        merged = {name: RunningStats(self.bins, self.histRanges[name]) for name in self.quantities}
+        for shard in range(self.numShards):
+            if not os.path.exists(self.shardFilename(shard)):
+                missing += [shard]
+                continue
+            with np.load(self.shardFilename(shard)) as data:
+                changed = self.changedSettings(shard, data)
+                if changed:
+                    raise ValueError(f"{self.shardFilename(shard)} was made with different settings {changed}")
+                for name in self.quantities:
+                    merged[name].merge(RunningStats.fromArrays(data, name))
+        if missing and not allowPartial:   # A partial merge must be asked for, so it can't be mistaken for the full result.
+            raise ValueError(f"{len(missing)} of {self.numShards} shards have not been run: {missing}")
+        return merged
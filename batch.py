@@ -0,0 +1,150 @@
+"""Headless batch runner for block-on-spring simulations
+
+Runs every JSON or YAML config given on the command line, or found in a
+given directory, concurrently in a pool of worker processes. Each config
+uses the same schema as ``block_config`` in `spring.py`. Plotting
+libraries are only imported when ``--plot`` is given, and PyYAML (an
+optional dependency) only when a YAML config is read, so a worker
+starts with little more than numpy and turboPy::
+
+    python batch.py configs/ --processes 4 --report timings.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from turbopy import Simulation
+
+import spring
+
+CONFIG_SUFFIXES = (".json", ".yaml", ".yml")
+
+
+def find_configs(paths):
+    """Return the config files named by `paths`
+
+    Directories are expanded to the config files they contain, in
+    sorted order.
+    """
+    configs = []
+    for path in paths:
+        if os.path.isdir(path):
+            configs += sorted(os.path.join(path, name)
+                              for name in os.listdir(path)
+                              if name.endswith(CONFIG_SUFFIXES))
+        else:
+            configs.append(path)
+    return configs
+
+
+def load_config(filename):
+    """Read a simulation config from a JSON or YAML file"""
+    with open(filename) as f:
+        if filename.endswith((".yaml", ".yml")):
+            import yaml
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def plot_simulation(sim: Simulation, filename):
+    """Save a plot of each block diagnostic against time to `filename`"""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    time_data = None
+    for diagnostic in sim.diagnostics:
+        if diagnostic._input_data["type"] == "clock":
+            time_data = diagnostic.csv._buffer[:, 0]
+    fig, ax = plt.subplots()
+    for diagnostic in sim.diagnostics:
+        if isinstance(diagnostic, spring.BlockDiagnostic) \
+                and diagnostic.csv is not None:
+            ax.plot(time_data, diagnostic.csv._buffer[:, 1],
+                    label=diagnostic.component)
+    ax.set_xlabel('time')
+    ax.legend()
+    fig.savefig(filename)
+    plt.close(fig)
+
+
+def run_config(filename, plot=False, verbose=False):
+    """Run the simulation described by one config file
+
+    Returns a dictionary with the config name, its status, and the time
+    in seconds spent loading, running and plotting it. Errors are
+    reported in the result rather than raised, so one bad config does
+    not stop the batch.
+    """
+    result = {"config": filename, "status": "ok"}
+    output = contextlib.nullcontext() if verbose \
+        else contextlib.redirect_stdout(io.StringIO())
+    start = time.perf_counter()
+    try:
+        config = load_config(filename)
+        loaded = time.perf_counter()
+        with output:
+            sim = Simulation(config)
+            sim.run()
+        finished = time.perf_counter()
+        result["load_seconds"] = loaded - start
+        result["run_seconds"] = finished - loaded
+        if plot:
+            directory = config["Diagnostics"].get("directory",
+                                                  "default_output")
+            name = os.path.splitext(os.path.basename(filename))[0]
+            plot_simulation(sim, os.path.join(directory, f"{name}.png"))
+            result["plot_seconds"] = time.perf_counter() - finished
+    except Exception as error:
+        result["status"] = f"{type(error).__name__}: {error}"
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def run_batch(configs, processes=1, plot=False, verbose=False):
+    """Run a list of config files and return their results in order"""
+    if processes > 1:
+        with ProcessPoolExecutor(processes) as executor:
+            return list(executor.map(run_config, configs,
+                                     [plot] * len(configs),
+                                     [verbose] * len(configs)))
+    return [run_config(config, plot, verbose) for config in configs]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="+",
+                        help="JSON or YAML config files, or directories of "
+                             "them (YAML needs PyYAML)")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(),
+                        help="number of worker processes")
+    parser.add_argument("--plot", action="store_true",
+                        help="save a plot next to each simulation's output")
+    parser.add_argument("--verbose", action="store_true",
+                        help="show the output of each simulation")
+    parser.add_argument("--report", help="JSON file for per-config timings")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    results = run_batch(find_configs(args.paths), args.processes,
+                        args.plot, args.verbose)
+    total = time.perf_counter() - start
+
+    print(f"{'config':<40} {'seconds':>10}  status")
+    for result in results:
+        print(f"{result['config']:<40} {result['seconds']:>10.3f}  "
+              f"{result['status']}")
+    print(f"{len(results)} configs in {total:.3f} s")
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump({"seconds": total, "configs": results}, f, indent=2)
+    return 0 if all(r["status"] == "ok" for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,238 @@
+"""Benchmarks for the block-on-spring turboPy app
+
+Every benchmark is reported as a rate, so larger numbers are better:
+
+- ``push:<pusher>:<N>`` : pusher steps per second for an ensemble of
+  ``N`` blocks
+- ``setup`` : simulations constructed and prepared per second
+- ``write:<csv|npy>`` : diagnostic rows written to file per second
+- ``montecarlo`` : end-to-end `MonteCarlo` samples per second
+
+Results are saved as JSON, and one results file can be compared with a
+baseline to flag slowdowns::
+
+    python benchmark.py run --output baseline.json
+    python benchmark.py run --output new.json
+    python benchmark.py compare baseline.json new.json --threshold 0.1
+"""
+import argparse
+import contextlib
+import copy
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+from turbopy import Simulation, CSVOutputUtility, NPYOutputUtility
+
+import spring
+import Uncertainty as UQ
+
+PUSHERS = ("ForwardEuler", "BackwardEuler", "Leapfrog")
+ENSEMBLE_SIZES = (1, 10, 100, 1000, 10 ** 4, 10 ** 5, 10 ** 6)
+WRITERS = {"csv": CSVOutputUtility, "npy": NPYOutputUtility}
+
+block_config = {
+    "Clock": {"start_time": 0,
+              "end_time": 10,
+              "num_steps": 100},
+    "PhysicsModules": {
+        "BlockOnSpring": {
+            "mass": 1,
+            "spring_constant": 1,
+            "pusher": "Leapfrog",
+            "x0": [0, 1, 0],
+        }
+    },
+    "Tools": {
+        "Leapfrog": {},
+        "ForwardEuler": {},
+        "BackwardEuler": {},
+    },
+    "Diagnostics": {
+        "directory": "benchmark_output/",
+        "output_type": "csv",
+        "clock": {"filename": "time.csv"},
+        "BlockDiagnostic": [
+            {'component': 'momentum', 'filename': 'block_p.csv'},
+            {'component': 'position', 'filename': 'block_x.csv'}
+        ]
+    }
+}
+
+
+def measure(func, min_time=0.2, repeat=3):
+    """Return the best time in seconds for one call of `func`
+
+    The number of calls per timing is increased until a timing takes at
+    least `min_time` divided by `repeat` seconds, and the best of
+    `repeat` timings is used.
+    """
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time / repeat:
+            break
+        number *= 10
+    best = elapsed
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, time.perf_counter() - start)
+    return best / number
+
+
+def bench_pushers(sizes, min_time):
+    """Pusher steps per second for each ensemble size"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        sim = Simulation(copy.deepcopy(block_config))
+        sim.read_clock_from_input()
+        sim.read_tools_from_input()
+        for tool in sim.compute_tools:
+            tool.initialize()
+    results = {}
+    for pusher in PUSHERS:
+        push = sim.find_tool_by_name(pusher).push
+        for size in sizes:
+            position = np.zeros((size, 3))
+            position[:, 1] = 1
+            momentum = np.zeros((size, 3))
+            seconds = measure(lambda: push(position, momentum, 1, 1),
+                              min_time)
+            results[f"push:{pusher}:{size}"] = {"rate": 1 / seconds,
+                                                "unit": "steps/s"}
+    return results
+
+
+def bench_setup(min_time, directory):
+    """Simulations constructed and prepared per second"""
+    config = copy.deepcopy(block_config)
+    config["Diagnostics"]["directory"] = directory
+
+    def setup():
+        sim = Simulation(copy.deepcopy(config))
+        sim.prepare_simulation()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        seconds = measure(setup, min_time)
+    return {"setup": {"rate": 1 / seconds, "unit": "simulations/s"}}
+
+
+def bench_writers(num_rows, min_time, directory):
+    """Diagnostic rows written to file per second for each format"""
+    results = {}
+    data = np.random.default_rng(0).normal(size=(num_rows, 3))
+    for name, writer_class in WRITERS.items():
+        writer = writer_class(os.path.join(directory, f"block.{name}"),
+                              data.shape)
+        writer._buffer[:] = data
+        seconds = measure(writer.finalize, min_time)
+        results[f"write:{name}"] = {"rate": num_rows / seconds,
+                                    "unit": "rows/s"}
+    return results
+
+
+def bench_montecarlo(num_samples, steps, min_time, directory):
+    """End-to-end MonteCarlo samples per second"""
+    runner = UQ.Uncertainty(3, 1, 0.05, 0.05)
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            seconds = measure(
+                lambda: UQ.MonteCarlo(runner, num_samples, steps=steps),
+                min_time)
+    finally:
+        os.chdir(cwd)
+    return {"montecarlo": {"rate": num_samples / seconds,
+                           "unit": "samples/s"}}
+
+
+def run(quick=False):
+    """Run all benchmarks and return the results dictionary
+
+    With `quick`, smaller problems and shorter timings are used, which is
+    useful for checking that the benchmarks work.
+    """
+    min_time = 0.01 if quick else 0.2
+    sizes = ENSEMBLE_SIZES[:3] if quick else ENSEMBLE_SIZES
+    benchmarks = {}
+    with tempfile.TemporaryDirectory() as directory:
+        benchmarks.update(bench_pushers(sizes, min_time))
+        benchmarks.update(bench_setup(min_time, directory))
+        benchmarks.update(bench_writers(100 if quick else 10000, min_time,
+                                        directory))
+        benchmarks.update(bench_montecarlo(2 if quick else 20,
+                                           10 if quick else 1200,
+                                           min_time, directory))
+    return {"machine": {"python": platform.python_version(),
+                        "numpy": np.__version__,
+                        "platform": platform.platform(),
+                        "processor": platform.processor()},
+            "benchmarks": benchmarks}
+
+
+def compare(baseline, results, threshold=0.1):
+    """Compare two results dictionaries
+
+    Returns a list of ``(name, baseline rate, new rate, ratio, flag)``
+    rows for the benchmarks found in both. `flag` is True when the new
+    rate is more than `threshold` (a fraction) below the baseline.
+    """
+    rows = []
+    for name, old in baseline["benchmarks"].items():
+        new = results["benchmarks"].get(name)
+        if new is None:
+            continue
+        ratio = new["rate"] / old["rate"]
+        rows.append((name, old["rate"], new["rate"], ratio,
+                     ratio < 1 - threshold))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument("--output", default="benchmark.json",
+                            help="JSON file for the results")
+    run_parser.add_argument("--quick", action="store_true",
+                            help="use small problems and short timings")
+    compare_parser = commands.add_parser(
+        "compare", help="flag slowdowns relative to a baseline")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("results")
+    compare_parser.add_argument("--threshold", type=float, default=0.1,
+                                help="allowed fractional slowdown")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        results = run(args.quick)
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        for name, result in results["benchmarks"].items():
+            print(f"{name:<32} {result['rate']:>14.4g} {result['unit']}")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.results) as f:
+        results = json.load(f)
+    rows = compare(baseline, results, args.threshold)
+    print(f"{'benchmark':<32} {'baseline':>12} {'new':>12} {'ratio':>8}")
+    for name, old, new, ratio, slower in rows:
+        flag = "  SLOWER" if slower else ""
+        print(f"{name:<32} {old:>12.4g} {new:>12.4g} {ratio:>8.3f}{flag}")
+    return 1 if any(row[-1] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
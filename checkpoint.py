@@ -0,0 +1,258 @@
+"""Checkpoint and restart support for the block-on-spring turboPy app
+
+A checkpoint is an ``.npz`` file holding the clock step, the position
+and momentum of every physics module and the state of numpy's global
+random number generator, plus chunk files holding the rows each
+CSV-backed diagnostic has recorded. Restarting from a checkpoint continues
+bit-identically to a run that was never interrupted.
+"""
+import contextlib
+import os
+import numpy as np
+
+from turbopy import Simulation, Diagnostic
+
+# Arrays of a physics module that make up its dynamical state
+MODULE_STATE = ("position", "momentum")
+
+
+def get_rng_state():
+    """Return the global numpy RNG state as a dictionary of arrays"""
+    name, keys, pos, has_gauss, cached_gaussian = np.random.get_state()
+    return {"rng:name": np.array(name),
+            "rng:keys": keys,
+            "rng:pos": np.array(pos),
+            "rng:has_gauss": np.array(has_gauss),
+            "rng:cached_gaussian": np.array(cached_gaussian)}
+
+
+def set_rng_state(data):
+    """Restore the global numpy RNG state saved by `get_rng_state`"""
+    np.random.set_state((str(data["rng:name"]),
+                         data["rng:keys"],
+                         int(data["rng:pos"]),
+                         int(data["rng:has_gauss"]),
+                         float(data["rng:cached_gaussian"])))
+
+
+def write_npz(filename, arrays):
+    """Atomically write a dictionary of arrays to an ``.npz`` file
+
+    The data is written to a temporary file which then replaces
+    `filename`, so a run killed mid-write never leaves a truncated file.
+    """
+    tmp_filename = f"{filename}.tmp"
+    with open(tmp_filename, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_filename, filename)
+
+
+def module_state(sim: Simulation):
+    """Return ``{key: array}`` for the state arrays of each module
+
+    Modules are identified by their name in the input data.
+    """
+    state = {}
+    for module in sim.physics_modules:
+        for name in MODULE_STATE:
+            if hasattr(module, name):
+                state[f"module:{module._input_data['name']}:{name}"] = \
+                    getattr(module, name)
+    return state
+
+
+def diagnostic_outputs(sim: Simulation):
+    """Return ``{key: output utility}`` for each CSV-backed diagnostic
+
+    Diagnostics are identified by the name of their output file without
+    its directory, so a restart may write to a different directory.
+
+    Raises
+    ------
+    ValueError
+        If two diagnostics write to files with the same name.
+    """
+    outputs = {}
+    for diagnostic in sim.diagnostics:
+        csv = getattr(diagnostic, "csv", None)
+        if csv is not None:
+            filename = os.path.basename(diagnostic._input_data["filename"])
+            key = f"diagnostic:{filename}:buffer"
+            if key in outputs:
+                raise ValueError(f"Cannot checkpoint two diagnostics "
+                                 f"writing to files named {filename}")
+            outputs[key] = csv
+    return outputs
+
+
+def chunk_filename(filename, start, stop):
+    """Return the name of the file holding diagnostic rows for steps
+    `start` to `stop`
+
+    Chunks written after a checkpoint at step `start` always start
+    there, so a chunk listed in a checkpoint is never overwritten.
+    """
+    return f"{filename}.{start}-{stop}"
+
+
+def save_checkpoint(sim: Simulation, filename, previous=None):
+    """Save the state of a prepared simulation to `filename`
+
+    The checkpoint describes the simulation at the start of step
+    ``sim.clock.this_step``, before any diagnostic has recorded it.
+    Diagnostic rows are appended to a new chunk file next to
+    `filename`, and `filename` itself only holds the clock, module and
+    RNG state and the list of chunks, so a checkpoint costs the same
+    however far the run has got.
+
+    Parameters
+    ----------
+    sim : Simulation
+        The simulation to save.
+    filename : str
+        Name of the checkpoint file.
+    previous : dict, optional
+        The value returned by the last call for this simulation and
+        `filename`, or by :func:`load_checkpoint` when resuming from
+        `filename`. Rows saved up to then are not written again.
+
+    Returns
+    -------
+    dict
+        A description of the chunks written so far, to pass as
+        `previous` to the next call.
+    """
+    step = sim.clock.this_step
+    previous = previous or {"chunks": []}
+    start = previous["chunks"][-1][1] if previous["chunks"] else 0
+    saved = {"chunks": previous["chunks"] + [(start, step)]}
+    rows = {}
+    for key, csv in diagnostic_outputs(sim).items():
+        # Only rows for steps before `step` are part of the state
+        saved[key] = min(csv._buffer_index, step)
+        rows[key] = csv._buffer[previous.get(key, 0):saved[key]]
+    write_npz(chunk_filename(filename, start, step), rows)
+
+    # The header is written last, so it never refers to an unfinished chunk
+    arrays = {"clock:this_step": np.array(step),
+              "chunks": np.array(saved["chunks"])}
+    arrays.update(module_state(sim))
+    arrays.update(get_rng_state())
+    write_npz(filename, arrays)
+    return saved
+
+
+def load_checkpoint(sim: Simulation, filename):
+    """Restore the state saved by `save_checkpoint` into `sim`
+
+    `sim` must be built from the same input data as the checkpointed
+    simulation, possibly with diagnostics listed in a different order,
+    and must already have been prepared with
+    :meth:`Simulation.prepare_simulation`.
+
+    Returns
+    -------
+    dict
+        A description of the saved chunks, to pass as `previous` to
+        :func:`save_checkpoint` when the resumed run saves to the same
+        `filename`.
+
+    Raises
+    ------
+    ValueError
+        If the modules and diagnostics of `sim` do not match those
+        saved in the checkpoint.
+    """
+    with np.load(filename) as data:
+        step = int(data["clock:this_step"])
+        state = {key: data[key] for key in data.files
+                 if key.startswith("module:")}
+        chunk_steps = [(int(start), int(stop))
+                       for start, stop in data["chunks"]]
+        rng_state = {key: data[key] for key in data.files
+                     if key.startswith("rng:")}
+    with contextlib.ExitStack() as stack:
+        chunks = [stack.enter_context(
+                      np.load(chunk_filename(filename, start, stop)))
+                  for start, stop in chunk_steps]
+        rows = {key: np.concatenate([chunk[key] for chunk in chunks])
+                for key in chunks[0].files}
+
+    module_arrays = module_state(sim)
+    outputs = diagnostic_outputs(sim)
+    saved = set(state) | set(rows)
+    expected = set(module_arrays) | set(outputs)
+    if saved != expected:
+        raise ValueError(f"Checkpoint {filename} does not match the "
+                         f"simulation: not in the simulation "
+                         f"{sorted(saved - expected)}, not in the "
+                         f"checkpoint {sorted(expected - saved)}")
+
+    sim.clock.turn_back(sim.clock.this_step - step)
+    for key, array in module_arrays.items():
+        # Copy in place so shared resources stay valid
+        array[:] = state[key]
+    for key, csv in outputs.items():
+        csv._buffer[:len(rows[key])] = rows[key]
+        csv._buffer_index = len(rows[key])
+    set_rng_state(rng_state)
+
+    saved = {"chunks": chunk_steps}
+    saved.update({key: len(rows[key]) for key in outputs})
+    return saved
+
+
+def run_from_checkpoint(sim: Simulation, filename):
+    """Run `sim` to completion starting from the checkpoint `filename`
+
+    This mirrors :meth:`Simulation.run`, but restores the checkpointed
+    state between preparing the simulation and entering the main loop.
+    """
+    print("Simulation is initializing")
+    sim.prepare_simulation()
+    print("Initialization complete")
+
+    print(f"Restoring checkpoint {filename}")
+    saved = load_checkpoint(sim, filename)
+    for diagnostic in sim.diagnostics:
+        # Keep appending to the checkpoint that was resumed from
+        if isinstance(diagnostic, CheckpointDiagnostic) and \
+                os.path.abspath(diagnostic.filename) == \
+                os.path.abspath(filename):
+            diagnostic.saved = saved
+
+    print(f"Simulation is resumed at step {sim.clock.this_step}")
+    while sim.clock.is_running():
+        sim.fundamental_cycle()
+
+    sim.finalize_simulation()
+    print("Simulation complete")
+
+
+class CheckpointDiagnostic(Diagnostic):
+    """Periodically save a checkpoint of the simulation
+
+    The checkpoint file is overwritten every ``"interval"`` steps, so it
+    always holds the most recent state.
+    """
+
+    def __init__(self, owner: Simulation, input_data: dict):
+        super().__init__(owner, input_data)
+        self.filename = input_data["filename"]
+        self.interval = input_data.get("interval", 1000)
+        self.saved = None
+
+    def diagnose(self):
+        step = self._owner.clock.this_step
+        if self.saved and self.saved["chunks"][-1][1] == step:
+            # This step is already saved, e.g. it was resumed from
+            return
+        if step > 0 and step % self.interval == 0:
+            self.saved = save_checkpoint(self._owner, self.filename,
+                                         self.saved)
+
+    def finalize(self):
+        pass
+
+
+Diagnostic.register("CheckpointDiagnostic", CheckpointDiagnostic)
@@ -0,0 +1,248 @@
+"""Opt-in instrumentation for the block-on-spring turboPy app
+
+A :class:`Profiler` records the wall time, call count and (optionally)
+peak traced memory allocation of each phase of a simulation: setup, the
+physics module update and pusher, resource exchange, diagnostics and
+output. Timings are inclusive, so ``BlockOnSpring.update`` contains the
+time spent in the pusher it calls.
+
+Instrumentation is off unless :func:`enable` has been called; the
+module level :func:`phase` and :func:`instrument` helpers are then
+no-ops, so instrumented code pays almost nothing for it.
+"""
+import contextlib
+import json
+import os
+import time
+import tracemalloc
+
+from turbopy import Simulation
+
+# The profiler used by `phase` and `instrument`, or None when disabled
+active = None
+
+
+class Profiler:
+    """Per-phase wall time, call count and allocation counters
+
+    Parameters
+    ----------
+    trace : bool
+        Also record every call as an event for a Chrome trace file.
+        This grows with the number of steps, so it is off by default.
+    allocations : bool
+        Also record, for each call, the peak memory allocated above the
+        level at the start of the call using :mod:`tracemalloc`, and
+        sum it over calls. Temporary arrays that are freed before the
+        call returns are counted. This slows the run down considerably.
+    """
+
+    def __init__(self, trace=False, allocations=False):
+        self.trace = trace
+        self.allocations = allocations
+        # name -> [calls, nanoseconds, peak bytes]
+        self.counters = {}
+        # (name, pid, start ns, duration ns)
+        self.events = []
+        # [memory at start, peak so far] for each phase being measured
+        self._memory = []
+        self.started_tracing = allocations and not tracemalloc.is_tracing()
+        if self.started_tracing:
+            tracemalloc.start()
+
+    def start_allocations(self):
+        """Start measuring the peak allocation of a phase
+
+        The tracemalloc peak is reset for each phase, so the peak seen
+        so far is first handed to the enclosing phase, if any.
+        """
+        current, peak = tracemalloc.get_traced_memory()
+        if self._memory:
+            self._memory[-1][1] = max(self._memory[-1][1], peak)
+        tracemalloc.reset_peak()
+        self._memory.append([current, current])
+
+    def stop_allocations(self):
+        """Return the peak bytes allocated since `start_allocations`"""
+        start, peak = self._memory.pop()
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        if self._memory:
+            self._memory[-1][1] = max(self._memory[-1][1], peak)
+        return peak - start
+
+    def record(self, name, start, stop, nbytes=0):
+        """Add one call of phase `name` to the counters"""
+        counter = self.counters.get(name)
+        if counter is None:
+            counter = self.counters[name] = [0, 0, 0]
+        counter[0] += 1
+        counter[1] += stop - start
+        counter[2] += nbytes
+        if self.trace:
+            self.events.append((name, os.getpid(), start, stop - start))
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Context manager recording the enclosed block as phase `name`"""
+        if self.allocations:
+            self.start_allocations()
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            stop = time.perf_counter_ns()
+            nbytes = self.stop_allocations() if self.allocations else 0
+            self.record(name, start, stop, nbytes)
+
+    def wrap(self, obj, method, name=None, after=None):
+        """Replace ``obj.method`` by a version that records its calls
+
+        If given, `after` is called with no arguments each time the
+        wrapped method returns.
+        """
+        func = getattr(obj, method)
+        name = name or f"{type(obj).__name__}.{method}"
+        perf_counter_ns = time.perf_counter_ns
+        allocations = self.allocations
+        start_allocations = self.start_allocations
+        stop_allocations = self.stop_allocations
+        record = self.record
+
+        def wrapper(*args, **kwargs):
+            if allocations:
+                start_allocations()
+            start = perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stop = perf_counter_ns()
+                nbytes = stop_allocations() if allocations else 0
+                record(name, start, stop, nbytes)
+                if after is not None:
+                    after()
+
+        setattr(obj, method, wrapper)
+
+    def instrument(self, sim: Simulation):
+        """Instrument a simulation before it is run
+
+        Physics modules, pushers, diagnostics and their output
+        utilities are created while the simulation is prepared, so they
+        are wrapped as soon as they exist.
+        """
+        def instrument_modules():
+            for module in sim.physics_modules:
+                self.wrap(module, "exchange_resources")
+                self.wrap(module, "update")
+                push = getattr(module, "push", None)
+                if push is not None:
+                    self.wrap(module, "push",
+                              f"{type(push.__self__).__name__}.push")
+
+        def instrument_diagnostic(diagnostic):
+            csv = getattr(diagnostic, "csv", None)
+            if csv is not None:
+                self.wrap(csv, "finalize")
+
+        def instrument_diagnostics():
+            for diagnostic in sim.diagnostics:
+                self.wrap(diagnostic, "diagnose")
+                self.wrap(diagnostic, "finalize")
+                self.wrap(diagnostic, "initialize",
+                          after=lambda d=diagnostic: instrument_diagnostic(d))
+
+        self.wrap(sim, "read_modules_from_input", after=instrument_modules)
+        self.wrap(sim, "read_diagnostics_from_input",
+                  after=instrument_diagnostics)
+        self.wrap(sim, "prepare_simulation", "Simulation.prepare_simulation")
+        self.wrap(sim, "fundamental_cycle", "Simulation.fundamental_cycle")
+        self.wrap(sim, "finalize_simulation", "Simulation.finalize_simulation")
+
+    def merge(self, other):
+        """Add the counters and events of another profiler to this one"""
+        for name, (calls, nanoseconds, nbytes) in other.counters.items():
+            counter = self.counters.setdefault(name, [0, 0, 0])
+            counter[0] += calls
+            counter[1] += nanoseconds
+            counter[2] += nbytes
+        self.events += other.events
+
+    def summary(self):
+        """Return the counters as a table, slowest phase first
+
+        The ``peak KiB`` column is the per-call peak allocation summed
+        over all calls of the phase.
+        """
+        lines = [f"{'phase':<36} {'calls':>10} {'total s':>10} "
+                 f"{'mean us':>10} {'peak KiB':>10}"]
+        for name, (calls, nanoseconds, nbytes) in sorted(
+                self.counters.items(), key=lambda item: -item[1][1]):
+            lines.append(f"{name:<36} {calls:>10d} {nanoseconds / 1e9:>10.4f} "
+                         f"{nanoseconds / 1e3 / calls:>10.2f} "
+                         f"{nbytes / 1024:>10.1f}")
+        return "\n".join(lines)
+
+    def write_json(self, filename):
+        """Write the counters to a JSON file"""
+        phases = {name: {"calls": calls,
+                         "seconds": nanoseconds / 1e9,
+                         "peak_bytes": nbytes}
+                  for name, (calls, nanoseconds, nbytes)
+                  in self.counters.items()}
+        with open(filename, 'w') as f:
+            json.dump({"phases": phases}, f, indent=2)
+
+    def write_chrome_trace(self, filename):
+        """Write the recorded events in the Chrome trace event format
+
+        The file can be opened in ``chrome://tracing`` or Perfetto.
+        """
+        events = [{"name": name, "ph": "X", "pid": pid, "tid": pid,
+                   "ts": start / 1e3, "dur": duration / 1e3}
+                  for name, pid, start, duration in self.events]
+        with open(filename, 'w') as f:
+            json.dump({"traceEvents": events}, f)
+
+    def report(self, directory):
+        """Print the summary table and write profile files to `directory`
+
+        Writes ``profile.json`` and, if events were traced,
+        ``trace.json``.
+        """
+        os.makedirs(directory, exist_ok=True)
+        print(self.summary())
+        self.write_json(os.path.join(directory, "profile.json"))
+        if self.trace:
+            self.write_chrome_trace(os.path.join(directory, "trace.json"))
+
+
+def enable(trace=False, allocations=False):
+    """Start recording with a new active profiler and return it"""
+    global active
+    active = Profiler(trace, allocations)
+    return active
+
+
+def disable():
+    """Stop recording and return the profiler that was active
+
+    Memory tracing is stopped if the profiler started it.
+    """
+    global active
+    profiler, active = active, None
+    if profiler is not None and profiler.started_tracing:
+        tracemalloc.stop()
+    return profiler
+
+
+def phase(name):
+    """Record the enclosed block as phase `name` if profiling is enabled"""
+    if active is None:
+        return contextlib.nullcontext()
+    return active.phase(name)
+
+
+def instrument(sim: Simulation):
+    """Instrument `sim` with the active profiler, if there is one"""
+    if active is not None:
+        active.instrument(sim)
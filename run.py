@@ -1,5 +1,4 @@
 from turbopy import Simulation
-import matplotlib.pyplot as plt
 import spring
 import Uncertainty as UQ
 
@@ -61,6 +60,8 @@ sim.run()
 
 
 
+import matplotlib.pyplot as plt
+
 time = sim.diagnostics[0].csv._buffer
 momentum = sim.diagnostics[1].csv._buffer[:,1]
 position = sim.diagnostics[2].csv._buffer[:,1]
@@ -4,8 +4,6 @@ This version of the example app uses the turobPy `HistoryDiagnostic` to
 save the simulation output to a single netCDF format file.
 """
 import numpy as np
-import xarray as xr
-import matplotlib.pyplot as plt
 
 from turbopy import Simulation, PhysicsModule, Diagnostic
 from turbopy import CSVOutputUtility, ComputeTool
@@ -151,6 +149,9 @@ if __name__ == "__main__":
     sim.run()
 
     # Now plot the outputs
+    import xarray as xr
+    import matplotlib.pyplot as plt
+
     lf_output = xr.load_dataset('output_leapfrog/output.nc')
     print(lf_output)
     lf_output['Block:position'][:,1].plot(x='time', label='Leapfrog')
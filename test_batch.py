@@ -0,0 +1,95 @@
+"""Tests for the headless batch runner"""
+import json
+import subprocess
+import sys
+import numpy as np
+import pytest
+import batch
+
+
+@pytest.fixture(name="configs")
+def configs_fixture(tmp_path):
+    """Writes a config file for each pusher and returns the directory"""
+    directory = tmp_path / "configs"
+    directory.mkdir()
+    for pusher in ["ForwardEuler", "Leapfrog"]:
+        block_config = {
+            "Clock": {"start_time": 0,
+                      "end_time": 1,
+                      "num_steps": 10},
+            "PhysicsModules": {
+                "BlockOnSpring": {
+                    "pusher": pusher,
+                    "x0": [0, 1, 0],
+                }
+            },
+            "Tools": {pusher: {}},
+            "Diagnostics": {
+                "directory": str(tmp_path / f"output_{pusher}"),
+                "output_type": "csv",
+                "clock": {"filename": "time.csv"},
+                "BlockDiagnostic": [
+                    {'component': 'position', 'filename': 'block_x.csv'}
+                ]
+            }
+        }
+        with open(directory / f"{pusher}.json", 'w') as f:
+            json.dump(block_config, f)
+    return directory
+
+
+def test_batch_runs_configs(configs, tmp_path):
+    """Every config in a directory is run and timed"""
+    report = tmp_path / "report.json"
+    assert batch.main([str(configs), "--processes", "2",
+                       "--report", str(report)]) == 0
+    with open(report) as f:
+        results = json.load(f)["configs"]
+    assert [r["config"] for r in results] == [
+        str(configs / "ForwardEuler.json"), str(configs / "Leapfrog.json")]
+    for result in results:
+        assert result["status"] == "ok"
+        assert result["run_seconds"] <= result["seconds"]
+    position = np.genfromtxt(tmp_path / "output_Leapfrog" / "block_x.csv",
+                             delimiter=',')
+    assert position.shape == (11, 3)
+
+
+def test_batch_reports_errors(configs, tmp_path):
+    """A broken config is reported without stopping the others"""
+    with open(configs / "broken.json", 'w') as f:
+        f.write("{}")
+    results = batch.run_batch(batch.find_configs([str(configs)]))
+    assert [r["status"] == "ok" for r in results] == [True, True, False]
+    assert batch.main([str(configs), "--processes", "1"]) == 1
+
+
+def test_plot(configs, tmp_path):
+    """Plots are written next to the simulation output when asked for"""
+    result = batch.run_config(str(configs / "Leapfrog.json"), plot=True)
+    assert result["status"] == "ok"
+    assert (tmp_path / "output_Leapfrog" / "Leapfrog.png").exists()
+
+
+def test_no_plotting_imports(configs):
+    """Running a batch without plots never imports matplotlib"""
+    code = ("import sys, batch; "
+            f"batch.run_batch([{str(configs / 'Leapfrog.json')!r}]); "
+            "print('matplotlib' in sys.modules)")
+    output = subprocess.run([sys.executable, "-c", code], check=True,
+                            capture_output=True, text=True).stdout
+    assert output.strip() == "False"
+
+
+def test_yaml_config(configs, tmp_path):
+    """YAML configs are read the same way as JSON configs"""
+    yaml = pytest.importorskip("yaml")
+    with open(configs / "Leapfrog.json") as f:
+        config = json.load(f)
+    config["Diagnostics"]["directory"] = str(tmp_path / "output_yaml")
+    with open(configs / "Leapfrog.yaml", 'w') as f:
+        yaml.safe_dump(config, f)
+    assert batch.load_config(str(configs / "Leapfrog.yaml")) == config
+    result = batch.run_config(str(configs / "Leapfrog.yaml"))
+    assert result["status"] == "ok"
+    assert (tmp_path / "output_yaml" / "block_x.csv").exists()
@@ -0,0 +1,29 @@
+"""Tests for the block-on-spring benchmark suite"""
+import json
+import benchmark
+
+
+def results(**rates):
+    """Returns a results dictionary with the given benchmark rates"""
+    return {"benchmarks": {name: {"rate": rate, "unit": "steps/s"}
+                           for name, rate in rates.items()}}
+
+
+def test_compare_flags_slowdowns():
+    """Only rates that dropped by more than the threshold are flagged"""
+    baseline = results(fast=100.0, slow=100.0, faster=100.0, removed=1.0)
+    new = results(fast=95.0, slow=80.0, faster=150.0, added=1.0)
+    rows = benchmark.compare(baseline, new, threshold=0.1)
+    flags = {row[0]: row[-1] for row in rows}
+    assert flags == {"fast": False, "slow": True, "faster": False}
+
+
+def test_run_and_compare(tmp_path):
+    """The command line runs the quick suite and compares the results"""
+    filename = tmp_path / "baseline.json"
+    assert benchmark.main(["run", "--quick", "--output", str(filename)]) == 0
+    with open(filename) as f:
+        names = json.load(f)["benchmarks"].keys()
+    assert "push:Leapfrog:100" in names
+    assert {"setup", "write:csv", "write:npy", "montecarlo"} <= set(names)
+    assert benchmark.main(["compare", str(filename), str(filename)]) == 0
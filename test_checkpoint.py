@@ -0,0 +1,172 @@
+"""Tests for checkpoint and restart of the block-on-spring turboPy app"""
+from pathlib import Path
+import numpy as np
+import pytest
+from turbopy import Simulation
+import spring
+import checkpoint
+import Uncertainty as UQ
+
+
+@pytest.fixture(name="bos_config")
+def bos_fixture(tmp_path):
+    """Returns a function that creates B.O.S input data writing to `tmp_path`"""
+    def make_config(directory, checkpoint_interval=None):
+        block_config = {
+            "Clock": {"start_time": 0,
+                      "end_time": 10,
+                      "num_steps": 100},
+            "PhysicsModules": {
+                "BlockOnSpring": {
+                    "mass": 1,
+                    "spring_constant": 1,
+                    "pusher": "Leapfrog",
+                    "x0": [0, 1, 0],
+                }
+            },
+            "Tools": {
+                "Leapfrog": {},
+            },
+            "Diagnostics": {
+                "directory": str(tmp_path / directory),
+                "output_type": "csv",
+                "clock": {"filename": "time.csv"},
+                "BlockDiagnostic": [
+                    {'component': 'momentum', 'filename': 'block_p.csv'},
+                    {'component': 'position', 'filename': 'block_x.csv'}
+                ]
+            }
+        }
+        if checkpoint_interval is not None:
+            block_config["Diagnostics"]["CheckpointDiagnostic"] = {
+                "filename": "checkpoint.npz",
+                "interval": checkpoint_interval}
+        return block_config
+    return make_config
+
+
+def test_restart_is_bit_identical(bos_config, tmp_path):
+    """A run restarted from a checkpoint reproduces an uninterrupted run"""
+    sim = Simulation(bos_config("full"))
+    sim.run()
+
+    # The checkpoint is overwritten every 30 steps, so it holds step 90
+    sim = Simulation(bos_config("checkpointed", checkpoint_interval=30))
+    sim.run()
+    filename = tmp_path / "checkpointed" / "checkpoint.npz"
+    with np.load(filename) as data:
+        assert int(data["clock:this_step"]) == 90
+
+    sim = Simulation(bos_config("restarted"))
+    checkpoint.run_from_checkpoint(sim, filename)
+    for name in ['block_p', 'block_x', 'time']:
+        ref_data = np.genfromtxt(tmp_path / "full" / f"{name}.csv",
+                                 delimiter=',')
+        tmp_data = np.genfromtxt(tmp_path / "restarted" / f"{name}.csv",
+                                 delimiter=',')
+        np.testing.assert_array_equal(ref_data, tmp_data)
+
+
+def test_restart_with_reordered_diagnostics(bos_config, tmp_path):
+    """Saved state is matched to diagnostics by file name, not position"""
+    sim = Simulation(bos_config("full"))
+    sim.run()
+
+    config = bos_config("checkpointed", checkpoint_interval=30)
+    config["Diagnostics"] = dict(reversed(config["Diagnostics"].items()))
+    sim = Simulation(config)
+    sim.run()
+    filename = tmp_path / "checkpointed" / "checkpoint.npz"
+    # Each checkpoint only saves the rows recorded since the last one
+    with np.load(checkpoint.chunk_filename(filename, 60, 90)) as data:
+        assert data["diagnostic:time.csv:buffer"].shape == (30, 1)
+
+    sim = Simulation(bos_config("restarted"))
+    checkpoint.run_from_checkpoint(sim, filename)
+    for name in ['block_p', 'block_x', 'time']:
+        ref_data = np.genfromtxt(tmp_path / "full" / f"{name}.csv",
+                                 delimiter=',')
+        tmp_data = np.genfromtxt(tmp_path / "restarted" / f"{name}.csv",
+                                 delimiter=',')
+        np.testing.assert_array_equal(ref_data, tmp_data)
+
+
+def test_restart_with_different_diagnostics(bos_config, tmp_path):
+    """A checkpoint is not loaded into a simulation it does not match"""
+    sim = Simulation(bos_config("checkpointed", checkpoint_interval=30))
+    sim.run()
+    config = bos_config("restarted")
+    del config["Diagnostics"]["BlockDiagnostic"][0]
+    sim = Simulation(config)
+    sim.prepare_simulation()
+    with pytest.raises(ValueError, match="block_p.csv"):
+        checkpoint.load_checkpoint(
+            sim, tmp_path / "checkpointed" / "checkpoint.npz")
+
+
+def test_resume_keeps_appending(bos_config, tmp_path):
+    """A resumed run appends new chunks and leaves saved ones unchanged"""
+    sim = Simulation(bos_config("full"))
+    sim.run()
+
+    # Stop a run just after its checkpoint at step 60
+    sim = Simulation(bos_config("checkpointed", checkpoint_interval=30))
+    sim.prepare_simulation()
+    while sim.clock.this_step <= 60:
+        sim.fundamental_cycle()
+    filename = tmp_path / "checkpointed" / "checkpoint.npz"
+    chunks = {(start, stop): Path(checkpoint.chunk_filename(
+                  filename, start, stop)).read_bytes()
+              for start, stop in [(0, 30), (30, 60)]}
+
+    sim = Simulation(bos_config("checkpointed", checkpoint_interval=30))
+    checkpoint.run_from_checkpoint(sim, filename)
+    for (start, stop), contents in chunks.items():
+        assert Path(checkpoint.chunk_filename(
+            filename, start, stop)).read_bytes() == contents
+    with np.load(filename) as data:
+        assert data["chunks"].tolist() == [[0, 30], [30, 60], [60, 90]]
+    with np.load(checkpoint.chunk_filename(filename, 60, 90)) as data:
+        assert data["diagnostic:time.csv:buffer"].shape == (30, 1)
+    for name in ['block_p', 'block_x', 'time']:
+        ref_data = np.genfromtxt(tmp_path / "full" / f"{name}.csv",
+                                 delimiter=',')
+        tmp_data = np.genfromtxt(tmp_path / "checkpointed" / f"{name}.csv",
+                                 delimiter=',')
+        np.testing.assert_array_equal(ref_data, tmp_data)
+
+
+def test_rng_state_roundtrip(tmp_path):
+    """The global RNG continues the same sequence after a restore"""
+    filename = tmp_path / "rng.npz"
+    np.random.seed(1)
+    np.random.normal()
+    checkpoint.write_npz(filename, checkpoint.get_rng_state())
+    expected = np.random.normal(size=5)
+    with np.load(filename) as data:
+        checkpoint.set_rng_state(data)
+    np.testing.assert_array_equal(np.random.normal(size=5), expected)
+
+
+def test_monte_carlo_resume(tmp_path, monkeypatch):
+    """A resumed MonteCarlo campaign matches an uninterrupted one"""
+    monkeypatch.chdir(tmp_path)
+    np.random.seed(2)
+    runner = UQ.Uncertainty(3, 1, 0.05, 0.05)
+    full = UQ.MonteCarlo(runner, 6, t1=1, steps=10)
+
+    filename = tmp_path / "mc.npz"
+    np.random.seed(2)
+    runner = UQ.Uncertainty(3, 1, 0.05, 0.05)
+    UQ.MonteCarlo(runner, 4, t1=1, steps=10, checkpointFile=filename,
+                  checkpointInterval=2)
+    runner = UQ.Uncertainty(3, 1, 0.05, 0.05)
+    resumed = UQ.MonteCarlo(runner, 6, t1=1, steps=10,
+                            checkpointFile=filename)
+    assert list(resumed.dataDct) == list(full.dataDct)
+    assert resumed.dataDct == full.dataDct
+    # Each save appends a chunk with only the runs since the last one
+    with np.load(f"{filename}.0001") as data:
+        assert len(data["keys"]) == 2
+    with np.load(filename) as data:
+        assert int(data["numChunks"]) == 3
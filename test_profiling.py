@@ -0,0 +1,85 @@
+"""Tests for the opt-in profiling of the block-on-spring turboPy app"""
+import json
+import tracemalloc
+import pytest
+from turbopy import Simulation
+import spring
+import profiling
+import Uncertainty as UQ
+
+
+@pytest.fixture(name="profiler")
+def profiler_fixture():
+    """Enables profiling for one test"""
+    yield profiling.enable(trace=True)
+    profiling.disable()
+
+
+def test_disabled_by_default():
+    """Without enable() the helpers do nothing"""
+    assert profiling.active is None
+    with profiling.phase("unused"):
+        pass
+
+
+def test_simulation_phases(profiler, tmp_path):
+    """Each phase of a run is counted once per call"""
+    config = {
+        "Clock": {"start_time": 0, "end_time": 1, "num_steps": 10},
+        "PhysicsModules": {
+            "BlockOnSpring": {"pusher": "Leapfrog", "x0": [0, 1, 0]}
+        },
+        "Tools": {"Leapfrog": {}},
+        "Diagnostics": {
+            "directory": str(tmp_path),
+            "output_type": "csv",
+            "clock": {"filename": "time.csv"},
+            "BlockDiagnostic": [
+                {'component': 'position', 'filename': 'block_x.csv'}
+            ]
+        }
+    }
+    sim = Simulation(config)
+    profiling.instrument(sim)
+    sim.run()
+    calls = {name: counter[0] for name, counter in profiler.counters.items()}
+    assert calls["Simulation.prepare_simulation"] == 1
+    assert calls["BlockOnSpring.exchange_resources"] == 1
+    assert calls["BlockOnSpring.update"] == 10
+    assert calls["Leapfrog.push"] == 10
+    # diagnose is called once more by finalize
+    assert calls["BlockDiagnostic.diagnose"] == 11
+    # one CSV file each for the clock and the block diagnostic
+    assert calls["CSVOutputUtility.finalize"] == 2
+
+    profiler.report(tmp_path / "profile")
+    with open(tmp_path / "profile" / "profile.json") as f:
+        phases = json.load(f)["phases"]
+    assert phases["Leapfrog.push"]["calls"] == 10
+    with open(tmp_path / "profile" / "trace.json") as f:
+        events = json.load(f)["traceEvents"]
+    assert len(events) == sum(calls.values())
+
+
+def test_campaign_workers_are_merged(profiler, tmp_path):
+    """Counters recorded in worker processes reach the parent profiler"""
+    runner = UQ.Uncertainty(3, 1, 0.05, 0.05)
+    campaign = UQ.Campaign(runner, 4, 2, str(tmp_path / "campaign"),
+                           t1=1, steps=10)
+    campaign.run(processes=2)
+    assert profiler.counters["Uncertainty.run:setup"][0] == 4
+    assert profiler.counters["Leapfrog.push"][0] == 40
+
+
+def test_allocations():
+    """Temporary allocations are counted, and tracing stops on disable"""
+    profiler = profiling.enable(allocations=True)
+    with profiling.phase("outer"):
+        with profiling.phase("temporary"):
+            data = bytearray(8 * 2 ** 20)
+            del data
+    assert profiling.disable() is profiler
+    assert not tracemalloc.is_tracing()
+    assert profiler.counters["temporary"][2] >= 8 * 2 ** 20
+    # The enclosing phase sees the peak of the phase inside it
+    assert profiler.counters["outer"][2] >= 8 * 2 ** 20
@@ -0,0 +1,70 @@
+"""Tests for sharded Monte Carlo campaigns"""
+import numpy as np
+import pytest
+import Uncertainty as UQ
+
+
+def test_campaign_merge_and_resume(tmp_path):
+    """Sharded campaigns merge exactly and only rerun missing shards"""
+    runner = UQ.Uncertainty(3, 1, 0.05, 0.05)
+    campaign = UQ.Campaign(runner, 10, 4, str(tmp_path / "campaign"),
+                           seed=5, t1=1, steps=10, bins=10)
+    campaign.run(processes=2)
+    assert campaign.missingShards() == []
+
+    samples = []
+    for shard in range(4):
+        with np.load(campaign.shardFilename(shard)) as data:
+            samples += list(data["maxMomentum"])
+    assert len(samples) == 10
+    stats = campaign.merge()["maxMomentum"]
+    assert stats.count == 10
+    assert stats.mean == pytest.approx(np.mean(samples))
+    assert stats.variance == pytest.approx(np.var(samples))
+    assert stats.min == min(samples)
+    assert stats.max == max(samples)
+    np.testing.assert_array_equal(
+        stats.hist, np.histogram(samples, stats.edges)[0])
+
+    # A restarted campaign recomputes the missing shard identically
+    with np.load(campaign.shardFilename(2)) as data:
+        expected = data["maxMomentum"]
+    (tmp_path / "campaign" / "shard_0002.npz").unlink()
+    mtime = (tmp_path / "campaign" / "shard_0000.npz").stat().st_mtime_ns
+    campaign.run()
+    assert (tmp_path / "campaign" / "shard_0000.npz").stat().st_mtime_ns \
+        == mtime
+    with np.load(campaign.shardFilename(2)) as data:
+        np.testing.assert_array_equal(data["maxMomentum"], expected)
+
+
+def test_campaign_stale_and_missing_shards(tmp_path):
+    """Shards from other settings are rerun, and partial merges raise"""
+    directory = str(tmp_path / "campaign")
+    runner = UQ.Uncertainty(3, 1, 0.05, 0.05)
+    UQ.Campaign(runner, 4, 2, directory, seed=1, t1=1, steps=10).run()
+
+    campaign = UQ.Campaign(runner, 6, 3, directory, seed=2, t1=1, steps=10)
+    with pytest.raises(ValueError, match="different settings"):
+        campaign.merge()
+    with pytest.warns(UserWarning, match="will be rerun"):
+        assert campaign.missingShards() == [0, 1, 2]
+    campaign.runShard(0)
+    with pytest.raises(ValueError, match="different settings"):
+        campaign.merge()
+
+    campaign.runShard(1)
+    (tmp_path / "campaign" / "shard_0001.npz").unlink()
+    with pytest.raises(ValueError, match="2 of 3 shards"):
+        campaign.merge()
+    assert campaign.merge(allowPartial=True)["maxMomentum"].count == 2
+
+    # Shards are also stale when the simulation settings change
+    campaign.runShard(1)
+    campaign.runShard(2)
+    longer = UQ.Campaign(runner, 6, 3, directory, seed=2, t1=1, steps=20)
+    with pytest.raises(ValueError, match="steps"):
+        longer.merge()
+    with pytest.warns(UserWarning, match="steps"):
+        assert longer.missingShards() == [0, 1, 2]
+    assert campaign.missingShards() == []